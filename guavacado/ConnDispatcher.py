@@ -4,37 +4,83 @@ import threading
 
 from .misc import init_logger, addr_rep
 from .ConnListener import ConnListener
+from .SelectorEngine import SelectorEngine
 
 class ConnDispatcher(object):
-	'''handles dispatching connections from multiple ConnListener instances to the proper callback functions'''
-	def __init__(self):
+	'''
+	handles dispatching connections from multiple ConnListener instances to the proper callback functions
+	- `engine` is either `'thread'` to accept connections in a thread per listener and handle each connection in its own thread,
+		or `'selector'` to watch all listeners and idle connections using a `SelectorEngine`
+	'''
+	def __init__(self, worker_pool=None, engine='thread', selector_loops=None, timeout=None):
 		self.log_handler = init_logger(__name__)
 		self.conn_listeners = {}
+		self.worker_pool = worker_pool
+		self.engine = engine
+		self.selector_loops = selector_loops
+		self.timeout = timeout
+		self.selector_engine = None
 	
 	def get_conn_listener(self, name):
 		return self.conn_listeners[name]
 	
-	def add_conn_listener(self, addr, conn_handler, name=None):
+	def add_conn_listener(self, addr, conn_handler, name=None, worker_pool=None, http=False):
+		'''
+		adds a `ConnListener` for the given address, calling `conn_handler` for each connection
+		- `worker_pool` can be a `WorkerPool` used only by this listener - if None, the pool shared by this dispatcher is used (if any)
+		- `http` indicates `conn_handler` handles HTTP requests, so the selector engine can receive the request before calling it
+		'''
 		if name is None:
 			name = "gen_conn_listener_"+str(addr)
-		def handle_callback(clientsocket, address, client_id, name=name):
-			self.conn_listeners[name]['handler'](clientsocket, address, client_id)
-		self.conn_listeners[name] = {'listener':ConnListener(handle_callback, addr=addr), 'handler':conn_handler, 'addr':addr}
+		if worker_pool is None:
+			worker_pool = self.worker_pool
+		def handle_callback(clientsocket, address, client_id, name=name, **kwargs):
+			self.conn_listeners[name]['handler'](clientsocket, address, client_id, **kwargs)
+		self.conn_listeners[name] = {'listener':ConnListener(handle_callback, addr=addr, worker_pool=worker_pool), 'handler':conn_handler, 'addr':addr, 'worker_pool':worker_pool, 'http':http}
 		return name
 	
+	def get_worker_pools(self):
+		'''returns a list of the distinct `WorkerPool` instances used by the listeners of this dispatcher'''
+		ret = []
+		for pool in [self.worker_pool]+[listener['worker_pool'] for listener in self.conn_listeners.values()]:
+			if pool is not None and pool not in ret:
+				ret.append(pool)
+		return ret
+	
+	def uses_selector(self, listener):
+		'''returns whether the given listener is handled by the selector engine instead of its own thread'''
+		return self.engine=='selector' and not listener['listener'].udp
+
 	def start_service(self):
+		if self.engine=='selector':
+			self.selector_engine = SelectorEngine(num_loops=self.selector_loops, timeout=self.timeout)
 		for _listener_name, listener in self.conn_listeners.items():
+			if self.uses_selector(listener):
+				self.log_handler.debug('Adding connection listener for {addr} to the selector engine'.format(addr=addr_rep(listener['addr'])))
+				self.selector_engine.add_listener(listener['listener'], listener['listener'].conn_callback, http=listener['http'], worker_pool=listener['worker_pool'])
+				continue
 			self.log_handler.debug('Starting connection listener for {addr}'.format(addr=addr_rep(listener['addr'])))
 			listener['thread'] = threading.Thread(target=listener['listener'].run, name='conn_listener_{addr}'.format(addr=addr_rep(listener['addr'])))
 			listener['thread'].daemon = True
 			listener['thread'].start()
+		if self.selector_engine is not None:
+			self.selector_engine.start_service()
 	
 	def stop_service(self):
+		if self.selector_engine is not None:
+			self.log_handler.debug('Stopping selector engine')
+			self.selector_engine.stop_service()
 		for _listener_name, listener in self.conn_listeners.items():
 			self.log_handler.debug('Stopping connection listener for {addr}'.format(addr=addr_rep(listener['addr'])))
+			if self.uses_selector(listener):
+				listener['listener'].stop(wake_accept=False)
+				continue
 			listener['listener'].stop()
 			listener['thread'].join(60)
 			if listener['thread'].is_alive():
 				self.log_handler.warning('Continuing without closing connection listener thread for {addr} because it did not close!'.format(addr=addr_rep(listener['addr'])))
 			else:
 				self.log_handler.debug('Stopped connection listener for {addr}'.format(addr=addr_rep(listener['addr'])))
+		for pool in self.get_worker_pools():
+			self.log_handler.debug('Stopping worker pool {name}'.format(name=pool.name))
+			pool.stop()
@@ -2,7 +2,7 @@
 
 '''
 opens a socket listening for a connection from a client
-calls conn_callback in a new thread with a socket when a connection is established
+calls conn_callback in a new thread (or a thread from a `WorkerPool`) with a socket when a connection is established
 '''
 
 import socket
@@ -16,10 +16,12 @@ class ConnListener(object):
 	'''
 	opens a socket listening for a connection from a client
 	calls conn_callback in a new thread with a socket when a connection is established
+	if `worker_pool` is a `WorkerPool` instance, connections are queued to the pool instead of starting a new thread for each one
 	'''
-	def __init__(self, conn_callback, addr=None):
+	def __init__(self, conn_callback, addr=None, worker_pool=None):
 		self.log_handler = init_logger(__name__)
 		self.conn_callback = conn_callback
+		self.worker_pool = worker_pool
 		if addr is None:
 			self.addr = ('',80)
 			self.tls = None
@@ -100,11 +102,21 @@ class ConnListener(object):
 
 	def spawn_client_thread(self, clientsocket, address, sync=False):
 		'''
-		spawn a thread to handle the client socket
+		spawn a thread to handle the client socket, or queue it to the worker pool if one is set
 		keep track of the client thread and socket in a dictionary to be used for shutdown
 		'''
 		client_id = self.gen_client_id()
 		self.log_handler.debug('{addr} [id {id}] Connection established'.format(addr=addr_rep(address),id=client_id))
+		if self.worker_pool is not None and not sync:
+			self.client_info[client_id] = {
+				'socket':clientsocket,
+				'address':address,
+				'thread':None,
+			}
+			if not self.worker_pool.submit(self.handle_client, clientsocket, address, client_id):
+				self.log_handler.warning('{addr} [id {id}] Worker pool is stopped! Closing connection'.format(addr=addr_rep(address),id=client_id))
+				self.close_client(clientsocket, address, client_id)
+			return
 		client_thread = threading.Thread(
 			target=self.handle_client, 
 			args=(clientsocket, address, client_id), 
@@ -129,6 +141,10 @@ class ConnListener(object):
 		should be running in separate thread (unless synchronous)
 		'''
 		self.conn_callback(clientsocket, address, client_id)
+		self.close_client(clientsocket, address, client_id)
+
+	def close_client(self, clientsocket, address, client_id):
+		'''shut down and close the client socket, then free the client id'''
 		try:
 			self.log_handler.debug('{addr} [id {id}] Shutting down connection'.format(addr=addr_rep(address),id=client_id))
 			clientsocket.shutdown(socket.SHUT_RDWR)
@@ -176,11 +192,14 @@ class ConnListener(object):
 					self.log_handler.error("An error was encountered trying to accept a new socket connection!")
 					self.log_handler.error(traceback.format_exc())
 	
-	def stop(self):
-		'''stop accepting connections and shut down all sockets'''
+	def stop(self, wake_accept=True):
+		'''
+		stop accepting connections and shut down all sockets
+		- `wake_accept` connects to the listening socket to stop the thread waiting in `run` - not needed if `run` was never started
+		'''
 		self.log_handler.debug('Stopping server socket.')
 		self.stop_event.set()
-		if not self.udp:
+		if wake_accept and not self.udp:
 			# connect as fake client to stop the looping thread
 			if self.tls:
 				tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
@@ -213,6 +232,9 @@ class ConnListener(object):
 					client_dat['socket'].close()
 				except OSError:
 					pass
+				if client_dat['thread'] is None:
+					# handled by the worker pool, which is stopped by its owner
+					continue
 				self.log_handler.debug('Waiting for thread id {ident} to close'.format(ident=client_dat['thread'].ident))
 				if client_dat['thread'].is_alive():
 					client_dat['thread'].join(timeout=5)
@@ -14,8 +14,8 @@ class RedirectDispatcher(object):
 		self.timeout = timeout
 		self.target_domain = target_domain
 
-	def handle_connection(self, clientsocket, address, client_id):
-		handler = WebRequestHandler(clientsocket, address, client_id, self.request_handler, timeout=self.timeout)
+	def handle_connection(self, clientsocket, address, client_id, recv_buf=b'', conn_engine=None):
+		handler = WebRequestHandler(clientsocket, address, client_id, self.request_handler, timeout=self.timeout, recv_buf=recv_buf, conn_engine=conn_engine)
 		handler.handle_connection()
 	
 	def request_handler(self, url=None, method=None, headers=None, body=None):
@@ -0,0 +1,443 @@
+#! /usr/bin/env python
+
+'''
+event-driven connection engine using `selectors`
+multiplexes listening sockets and idle connections on a small number of selector loops,
+and only hands a connection to a thread once a complete request has been received
+'''
+
+import os
+import socket
+import ssl
+import selectors
+import threading
+import time
+import traceback
+import itertools
+from collections import deque
+
+from .misc import init_logger, addr_rep
+from .WebRequestHandler import parse_headers
+
+# sent to HTTP requests which cannot be handled because the worker pool is full
+service_unavailable_response = b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 1\r\nConnection: close\r\n\r\n'
+
+class SelectorEngine(object):
+	'''
+	event-driven connection engine using `selectors`
+	- `num_loops` is the number of selector loops (each in its own thread) - defaults to the number of CPU cores
+	- `timeout` is the number of seconds a new connection may take to send a complete request before it is closed
+	'''
+	def __init__(self, num_loops=None, timeout=None, recv_size=65536):
+		self.log_handler = init_logger(__name__)
+		if num_loops is None:
+			num_loops = os.cpu_count() or 1
+		self.timeout = timeout
+		self.recv_size = recv_size
+		self.loops = [SelectorLoop(self, loop_num) for loop_num in range(num_loops)]
+		self.listener_count = 0
+		self.conn_counter = itertools.count() # used to choose the loop watching each new connection
+		self.conns = {}
+		self.conns_lock = threading.Lock()
+
+	def add_listener(self, listener, handler, http=True, worker_pool=None):
+		'''
+		registers a `ConnListener` with one of the selector loops, which accepts its connections and spreads them between all of the loops (see `next_loop`)
+		listeners are not watched by every loop, since each connection would then wake every loop, and all but one would fail to accept it
+		- `handler` is called as `handler(clientsocket, address, client_id)` for each connection
+			- if `http` is True, `handler` is called only once a complete request is received, with the additional keyword arguments `recv_buf` and `conn_engine`
+		- `worker_pool` is the `WorkerPool` used to call `handler`, or None to start a new thread for each call
+		'''
+		listener.sock.setblocking(False)
+		listener_info = {'listener':listener, 'handler':handler, 'http':http, 'worker_pool':worker_pool}
+		# listeners are given to the loops in turn, so that several busy listeners are accepted in different threads
+		self.loops[self.listener_count % len(self.loops)].add_listener(listener_info)
+		self.listener_count = self.listener_count + 1
+
+	def next_loop(self):
+		'''returns the selector loop to watch a new connection, taking each loop in turn'''
+		return self.loops[next(self.conn_counter) % len(self.loops)]
+
+	def start_service(self):
+		'''starts the thread for each selector loop'''
+		for loop in self.loops:
+			loop.start()
+
+	def stop_service(self):
+		'''stops all selector loops and closes any connections they are holding'''
+		for loop in self.loops:
+			loop.stop()
+		with self.conns_lock:
+			conns = list(self.conns.values())
+		for conn in conns:
+			self.close(conn['sock'])
+		for loop in self.loops:
+			loop.selector.close()
+
+	def run_task(self, conn, callback, *args, busy_response=None):
+		'''
+		runs `callback(*args)` using the worker pool for the connection's listener, or in a new thread if there is no pool
+		the selector loops must not wait for room in the queue of the pool, so if it is full the connection is closed instead, after sending `busy_response` (if any)
+		'''
+		pool = conn['listener_info']['worker_pool']
+		if pool is not None:
+			if not pool.try_submit(callback, *args):
+				self.log_handler.warning('{addr} [id {id}] Worker pool is full! Closing connection'.format(addr=addr_rep(conn['address']), id=conn['client_id']))
+				if busy_response is not None:
+					try:
+						conn['sock'].send(busy_response) # the socket is not blocking, so this is skipped if the response does not fit in its buffer
+					except OSError:
+						pass
+				self.close(conn['sock'])
+		else:
+			thr = threading.Thread(target=callback, args=args, name='clienthandler_{}'.format(conn['client_id']))
+			thr.daemon = True # separated from Thread constructor for python2 compatibility
+			thr.start()
+
+	def dispatch(self, conn, callback, busy_response=None):
+		'''
+		called from a selector loop to hand the connection to a thread, which calls `callback()`
+		the connection is closed afterwards, unless `callback` parks it again by calling `park`
+		- `busy_response` is sent before closing the connection if the worker pool is full (see `run_task`)
+		'''
+		def run_conn(conn=conn, callback=callback):
+			token = object()
+			conn['token'] = token
+			conn['sock'].settimeout(conn['timeout'])
+			try:
+				callback()
+			except Exception:
+				self.log_handler.error('{addr} [id {id}] An error was encountered while handling the connection!'.format(addr=addr_rep(conn['address']), id=conn['client_id']))
+				self.log_handler.error(traceback.format_exc())
+				conn['parked_token'] = None
+			if conn.get('parked_token') is not token:
+				self.close(conn['sock'])
+		self.run_task(conn, run_conn, busy_response=busy_response)
+
+	def park(self, clientsocket, resume=None, timeout=None, recv_buf=b'', ready=False):
+		'''
+		returns a connection to the selector loop that accepted it, so that it does not hold a thread while idle
+		- `resume` is called from a thread once the socket has data to read
+			- if None, the connection is handled as a new HTTP request once a complete request is received in `recv_buf`
+		- `timeout` is the number of seconds the connection can be idle before it is closed - also restored as the socket timeout when resuming
+		- `ready` indicates data is already buffered, so `resume` should be called without waiting for the socket
+		'''
+		with self.conns_lock:
+			conn = self.conns.get(clientsocket)
+		if conn is None:
+			return False
+		conn['resume'] = resume
+		conn['timeout'] = timeout
+		conn['buf'] = bytearray(recv_buf)
+		conn['ready'] = ready
+		conn['parked_token'] = conn.get('token')
+		conn['loop'].call_soon(conn['loop'].register_conn, conn)
+		return True
+
+	def close(self, clientsocket):
+		'''shuts down and closes a connection owned by this engine, then frees its client id'''
+		with self.conns_lock:
+			conn = self.conns.pop(clientsocket, None)
+		if conn is None:
+			return
+		loop = conn['loop']
+		if loop.thread is None or not loop.thread.is_alive() or threading.current_thread() is loop.thread:
+			# unregister before closing, so the file descriptor cannot be reused while it is still registered
+			loop.unregister_conn(conn)
+		else:
+			loop.call_soon(loop.unregister_conn, conn)
+		listener = conn['listener_info']['listener']
+		listener.close_client(clientsocket, conn['address'], conn['client_id'])
+
+	@staticmethod
+	def is_request_complete(buf):
+		'''returns whether `buf` begins with a complete HTTP request, including the body'''
+		head_end = buf.find(b'\r\n\r\n')
+		if head_end < 0:
+			return False
+		headers = parse_headers(bytes(buf[:head_end]).decode('utf-8', 'replace'))
+		body_start = head_end + 4
+		if headers.get('Transfer-Encoding','')=='chunked':
+			pos = body_start
+			while True:
+				line_end = buf.find(b'\r\n', pos)
+				if line_end < 0:
+					return False
+				try:
+					chunk_len = int(bytes(buf[pos:line_end]).split(b';',1)[0], 16)
+				except ValueError:
+					return True # let the request handler report the invalid request
+				pos = line_end + 2 + chunk_len
+				trailer_end = buf.find(b'\r\n', pos)
+				if trailer_end < 0:
+					return False
+				pos = trailer_end + 2
+				if chunk_len==0:
+					return True
+		try:
+			content_length = int(headers.get('Content-Length','0'))
+		except ValueError:
+			return True # let the request handler report the invalid request
+		return len(buf) - body_start >= content_length
+
+class SelectorLoop(object):
+	'''a single selector loop running in its own thread, owned by a `SelectorEngine`'''
+	def __init__(self, engine, loop_num):
+		self.log_handler = init_logger(__name__)
+		self.engine = engine
+		self.loop_num = loop_num
+		self.selector = selectors.DefaultSelector()
+		self.pending = deque()
+		self.stop_event = threading.Event()
+		self.wake_recv, self.wake_send = socket.socketpair()
+		self.wake_recv.setblocking(False)
+		self.wake_send.setblocking(False)
+		self.selector.register(self.wake_recv, selectors.EVENT_READ, None)
+		self.conns = {}
+		self.thread = None
+
+	def add_listener(self, listener_info):
+		'''watches the listening socket of the given listener for new connections'''
+		self.selector.register(listener_info['listener'].sock, selectors.EVENT_READ, ('listener', listener_info))
+
+	def start(self):
+		'''starts the loop thread'''
+		self.thread = threading.Thread(target=self.run, name='selector_loop_{num}'.format(num=self.loop_num))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		'''stops the loop thread'''
+		self.stop_event.set()
+		self.wake()
+		if self.thread is not None:
+			self.thread.join(60)
+			if self.thread.is_alive():
+				self.log_handler.warning('Continuing without closing selector loop {num} because it did not close!'.format(num=self.loop_num))
+		for key in list(self.selector.get_map().values()):
+			if isinstance(key.data, tuple) and key.data[0]=='listener':
+				self.selector.unregister(key.fileobj)
+		self.wake_recv.close()
+		self.wake_send.close()
+
+	def wake(self):
+		'''interrupts the loop's call to `select`'''
+		try:
+			self.wake_send.send(b'\0')
+		except OSError:
+			pass
+
+	def call_soon(self, callback, *args):
+		'''runs `callback(*args)` in the loop thread - may be called from any thread'''
+		self.pending.append((callback, args))
+		self.wake()
+
+	def run(self):
+		'''waits for events on all registered sockets and handles them until stopped'''
+		last_sweep = time.time()
+		while not self.stop_event.is_set():
+			try:
+				events = self.selector.select(timeout=1)
+			except OSError:
+				self.log_handler.error('An error was encountered waiting for socket events!')
+				self.log_handler.error(traceback.format_exc())
+				continue
+			for key, mask in events:
+				if key.data is None:
+					try:
+						while self.wake_recv.recv(4096):
+							pass
+					except OSError:
+						pass
+				elif key.data[0]=='listener':
+					self.accept(key.data[1])
+				else:
+					self.handle_event(key.data[1], mask)
+			while len(self.pending) > 0:
+				callback, args = self.pending.popleft()
+				callback(*args)
+			if time.time() - last_sweep >= 1:
+				last_sweep = time.time()
+				self.close_timed_out()
+
+	def accept(self, listener_info):
+		'''accepts a new connection from the listener, and starts watching it in the next loop (see `SelectorEngine.next_loop`)'''
+		listener = listener_info['listener']
+		try:
+			clientsocket, address = listener.sock.accept()
+		except (BlockingIOError, InterruptedError):
+			return # the connection was reset before it could be accepted
+		except OSError:
+			if not listener.stop_event.is_set():
+				self.log_handler.error("An error was encountered trying to accept a new socket connection!")
+				self.log_handler.error(traceback.format_exc())
+			return
+		clientsocket.setblocking(False)
+		if listener.use_tls:
+			clientsocket = listener.tls_context.wrap_socket(clientsocket, server_side=True, do_handshake_on_connect=False)
+			state = 'handshake'
+		elif listener_info['http']:
+			state = 'reading'
+		else:
+			state = 'ready'
+		client_id = listener.gen_client_id()
+		self.log_handler.debug('{addr} [id {id}] Connection established'.format(addr=addr_rep(address),id=client_id))
+		loop = self.engine.next_loop()
+		conn = {
+			'sock':clientsocket,
+			'address':address,
+			'client_id':client_id,
+			'listener_info':listener_info,
+			'loop':loop,
+			'state':state,
+			'buf':bytearray(),
+			'resume':None,
+			'ready':False,
+			'timeout':self.engine.timeout,
+			'last_active':time.time(),
+		}
+		listener.client_info[client_id] = {
+			'socket':clientsocket,
+			'address':address,
+			'thread':None,
+		}
+		with self.engine.conns_lock:
+			self.engine.conns[clientsocket] = conn
+		if loop is self:
+			self.start_conn(conn)
+		else:
+			loop.call_soon(loop.start_conn, conn)
+
+	def start_conn(self, conn):
+		'''starts watching a newly accepted connection, or hands it to a thread if it is not HTTP - called in the loop thread'''
+		if conn['state']=='ready':
+			self.handle_ready(conn)
+		else:
+			self.register_conn(conn, state=conn['state'])
+			if conn['state']=='handshake':
+				self.handle_event(conn, selectors.EVENT_READ)
+
+	def register_conn(self, conn, state=None):
+		'''starts watching a connection for incoming data - called in the loop thread'''
+		if conn['sock'] not in self.engine.conns:
+			return
+		if state is None:
+			if conn['resume'] is None:
+				state = 'reading'
+			else:
+				state = 'parked'
+		conn['state'] = state
+		conn['last_active'] = time.time()
+		try:
+			conn['sock'].setblocking(False)
+			self.selector.register(conn['sock'], selectors.EVENT_READ, ('conn', conn))
+		except (OSError, ValueError, KeyError):
+			self.engine.close(conn['sock'])
+			return
+		self.conns[conn['sock']] = conn
+		if state=='reading' and len(conn['buf']) > 0 and self.engine.is_request_complete(conn['buf']):
+			self.handle_ready(conn)
+		elif state=='parked' and (conn['ready'] or self.has_pending_data(conn['sock'])):
+			self.handle_ready(conn)
+
+	def unregister_conn(self, conn):
+		'''stops watching a connection - called in the loop thread'''
+		try:
+			self.selector.unregister(conn['sock'])
+		except (KeyError, ValueError, OSError):
+			pass
+		self.conns.pop(conn['sock'], None)
+
+	@staticmethod
+	def has_pending_data(sock):
+		'''returns whether a TLS socket already has decrypted data buffered'''
+		pending = getattr(sock, 'pending', None)
+		return pending is not None and pending() > 0
+
+	def handle_event(self, conn, mask):
+		'''handles a socket event for a connection being watched by this loop'''
+		_mask = mask # suppresses linter warnings
+		conn['last_active'] = time.time()
+		if conn['state']=='handshake':
+			try:
+				conn['sock'].do_handshake()
+			except ssl.SSLWantReadError:
+				self.modify_events(conn, selectors.EVENT_READ)
+				return
+			except ssl.SSLWantWriteError:
+				self.modify_events(conn, selectors.EVENT_WRITE)
+				return
+			except ssl.SSLError as e:
+				if e.reason in ['SSLV3_ALERT_CERTIFICATE_UNKNOWN', 'TLSV1_ALERT_UNKNOWN_CA']:
+					self.log_handler.warning("The incoming client refused to connect due to an invalid certificate!")
+				else:
+					self.log_handler.error("An error was encountered trying to set up a TLS connection!")
+					self.log_handler.error(traceback.format_exc())
+				self.engine.close(conn['sock'])
+				return
+			except OSError:
+				self.engine.close(conn['sock'])
+				return
+			self.modify_events(conn, selectors.EVENT_READ)
+			if conn['listener_info']['http']:
+				conn['state'] = 'reading'
+			else:
+				self.handle_ready(conn)
+				return
+		if conn['state']=='reading':
+			while True:
+				try:
+					data = conn['sock'].recv(self.engine.recv_size)
+				except (BlockingIOError, InterruptedError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+					break
+				except OSError:
+					self.engine.close(conn['sock'])
+					return
+				if len(data)==0:
+					self.engine.close(conn['sock'])
+					return
+				conn['buf'] += data
+				if not self.has_pending_data(conn['sock']):
+					break
+			if self.engine.is_request_complete(conn['buf']):
+				self.handle_ready(conn)
+		elif conn['state']=='parked':
+			self.handle_ready(conn)
+
+	def modify_events(self, conn, events):
+		'''changes the events being watched for a connection'''
+		try:
+			self.selector.modify(conn['sock'], events, ('conn', conn))
+		except (KeyError, ValueError):
+			pass
+
+	def handle_ready(self, conn):
+		'''stops watching the connection and hands it to a thread'''
+		self.unregister_conn(conn)
+		listener_info = conn['listener_info']
+		resume = conn['resume']
+		conn['resume'] = None
+		conn['ready'] = False
+		busy_response = None
+		if resume is not None:
+			callback = resume
+		elif listener_info['http']:
+			busy_response = service_unavailable_response
+			recv_buf = bytes(conn['buf'])
+			conn['buf'] = bytearray()
+			def callback(conn=conn, recv_buf=recv_buf):
+				listener_info['handler'](conn['sock'], conn['address'], conn['client_id'], recv_buf=recv_buf, conn_engine=self.engine)
+		else:
+			def callback(conn=conn):
+				listener_info['handler'](conn['sock'], conn['address'], conn['client_id'])
+		conn['state'] = 'running'
+		self.engine.dispatch(conn, callback, busy_response=busy_response)
+
+	def close_timed_out(self):
+		'''closes any watched connections that have been idle for longer than their timeout'''
+		now = time.time()
+		for conn in list(self.conns.values()):
+			if conn['timeout'] is not None and now - conn['last_active'] > conn['timeout']:
+				self.log_handler.info('{addr} [id {id}] Connection timed out!'.format(addr=addr_rep(conn['address']), id=conn['client_id']))
+				self.unregister_conn(conn)
+				self.engine.close(conn['sock'])
@@ -17,7 +17,7 @@ class WebDispatcher(object):
 		self.resource_handlers = []
 		self.auth_handler = auth_handler
 
-	def handle_connection(self, clientsocket, address, client_id):
+	def handle_connection(self, clientsocket, address, client_id, recv_buf=b'', conn_engine=None):
 		def do_nothing(): # blank function for default if call_after_handled not set
 			pass
 		call_after_handled = {'call_after_handled':do_nothing} # stored as dictionary so that scope of the contained function can edit the value freely
@@ -34,7 +34,7 @@ class WebDispatcher(object):
 				return ret[0]
 			else:
 				return None
-		handler = WebRequestHandler(clientsocket, address, client_id, request_handler_noclient, timeout=self.timeout, auth_handler=self.auth_handler)
+		handler = WebRequestHandler(clientsocket, address, client_id, request_handler_noclient, timeout=self.timeout, auth_handler=self.auth_handler, recv_buf=recv_buf, conn_engine=conn_engine)
 		handler.handle_connection()
 		if call_after_handled['call_after_handled'] is not None:
 			call_after_handled['call_after_handled']()
@@ -7,6 +7,7 @@ Call `start_service` to start listening, then `stop_service` to stop listening
 
 from .WebDocs import WebDocs
 from .ConnDispatcher import ConnDispatcher
+from .WorkerPool import WorkerPool
 from .misc import init_logger, set_loglevel, addr_rep
 
 from .WebDispatcher import WebDispatcher
@@ -18,25 +19,39 @@ class WebHost(object):
 	Main class for the Guavacado server host
 	Instantiate `WebHost` then call `add_addr` for each port/IP address to listen on for hosting
 	Call `start_service` to start listening, then `stop_service` to stop listening
+	- `max_workers` limits the number of threads handling connections from all addresses to a shared `WorkerPool`
+		- if None, a new thread is started for each connection
+	- `worker_queue_depth` is the number of accepted connections that can wait for a free worker before accepting stops - 0 for no limit
+	- `engine` selects how connections are accepted and watched:
+		- `'thread'` - each address accepts connections in its own thread, and each connection is handled by a thread for its whole lifetime
+		- `'selector'` - all TCP addresses and idle connections are watched by `selectors` loops, and a thread is only used once a complete request is received
+	- `selector_loops` is the number of `selectors` loops to run with the `'selector'` engine - defaults to the number of CPU cores
 	'''
-	def __init__(self,timeout=10,loglevel='INFO', error_404_page_func=None):
+	def __init__(self,timeout=10,loglevel='INFO', error_404_page_func=None, max_workers=None, worker_queue_depth=0, engine='thread', selector_loops=None):
 		set_loglevel(loglevel)
 		self.log_handler = init_logger(__name__)
 		self.addr=[]
 		self.timeout = timeout
 		self.error_404_page_func = error_404_page_func
 		self.specialized_dispatchers = {}
-		self.dispatcher = ConnDispatcher()
+		if max_workers is None:
+			worker_pool = None
+		else:
+			worker_pool = WorkerPool(max_workers=max_workers, queue_depth=worker_queue_depth, name='shared_worker')
+		self.dispatcher = ConnDispatcher(worker_pool=worker_pool, engine=engine, selector_loops=selector_loops, timeout=timeout)
 		self.docs = WebDocs(self)
 		self.docs.connect_funcs()
 
-	def add_addr(self, addr=None, port=80, TLS=None, UDP=False, disp_type='web'):
+	def add_addr(self, addr=None, port=80, TLS=None, UDP=False, disp_type='web', max_workers=None, worker_queue_depth=0):
 		'''
 		adds an address to the dispatcher for it to listen on
 		- `addr` should be a hostname to listen on, or None to listen on all addresses
 		- `port` should be a port number to listen on
 		- `TLS` should be a tuple of two filenames to use for the certfile and keyfile for TLS, or None to use plain HTTP
 		- `UDP` indicates to use UDP instead of TCP
+		- `max_workers` gives this address its own `WorkerPool` with at most this many threads handling connections
+			- if None, the pool shared by the host is used (see the `max_workers` argument of `WebHost`)
+		- `worker_queue_depth` is the number of accepted connections that can wait for a free worker in this address's own pool - 0 for no limit
 		- `disp_type` should be one of the following:
 			- `'web'` - HTTP(S) server
 			- `('web', ident)` - HTTP(S) server with isolation from other HTTP(S) servers - `ident` can be any value, but any unique values will not share URLs
@@ -61,7 +76,12 @@ class WebHost(object):
 		# addr_tuple = ((addr,port),TLS)
 		addr_dict = {'addr':addr, 'port':port, 'TLS':TLS, 'UDP':UDP}
 		self.addr.append(addr_dict)
-		self.dispatcher.add_conn_listener(addr_dict, self.get_specialized_dispatcher(disp_type).handle_connection, name='WebDispatch_'+addr_rep(addr_dict))
+		if max_workers is None:
+			worker_pool = None
+		else:
+			worker_pool = WorkerPool(max_workers=max_workers, queue_depth=worker_queue_depth, name='worker_'+addr_rep(addr_dict))
+		disp = self.get_specialized_dispatcher(disp_type)
+		self.dispatcher.add_conn_listener(addr_dict, disp.handle_connection, name='WebDispatch_'+addr_rep(addr_dict), worker_pool=worker_pool, http=not isinstance(disp, RawSocketDispatcher))
 
 	def start_service(self):
 		'''
@@ -90,6 +110,14 @@ class WebHost(object):
 		'''
 		return self.dispatcher
 	
+	def get_worker_pool_stats(self):
+		'''
+		returns a dictionary of the stats of each `WorkerPool` used by this host, keyed by the name of the pool
+
+		see `WorkerPool.get_stats` for the contents of each entry, including the time connections waited in the queue
+		'''
+		return dict([(pool.name, pool.get_stats()) for pool in self.dispatcher.get_worker_pools()])
+	
 	def get_specialized_dispatcher(self, disp_type):
 		'''
 		return a dispatcher for the specified `disp_type`
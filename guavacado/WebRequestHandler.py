@@ -46,7 +46,7 @@ class WebRequestHandler(object):
 	def __init__(self,  # pylint: disable=W0102
 			clientsocket, address, client_id, request_handler, timeout=None, 
 			is_client=False, client_resource=None, client_body=None, client_method=None, client_host=None, client_include_response_headers=False, client_headers_as_lists=False, 
-			auth_handler=None, add_headers={}):
+			auth_handler=None, add_headers={}, recv_buf=b'', conn_engine=None):
 		self.log_handler = init_logger(__name__)
 		self.clientsocket = clientsocket
 		self.address = address
@@ -61,11 +61,12 @@ class WebRequestHandler(object):
 		self.client_headers_as_lists = client_headers_as_lists
 		self.auth_handler = auth_handler
 		self.add_headers = add_headers
+		self.conn_engine = conn_engine
 		self.success_status_code = 200
 		self.clientsocket.settimeout(timeout)
 
 		self.is_received = False
-		self.buf = b''
+		self.buf = recv_buf
 	
 	def setSuccessStatusCode(self, code):
 		self.success_status_code = code
@@ -128,12 +128,33 @@ class WebSocketHandler(object):
 			self.messages_waiting.notify_all()
 		msg_thread.join()
 	
+	def run_evented(self, conn_engine, closed_callback=None):
+		'''
+		receives messages without holding a thread while the connection is idle, by parking the socket in `conn_engine` (a `SelectorEngine`) between messages
+		messages are handled in the thread that received them once they are complete, and `closed_callback()` is called after the close frame is received
+		returns immediately - the connection is closed by `conn_engine` after `closed_callback` is called
+		'''
+		clientsocket = self.web_request_handler.clientsocket
+		timeout = clientsocket.gettimeout()
+		def resume():
+			self._recv_message()
+			self.handle_pending_messages()
+			if self.close_received:
+				if closed_callback is not None:
+					closed_callback()
+			else:
+				conn_engine.park(clientsocket, resume, timeout=timeout, ready=len(self.web_request_handler.buf) > 0)
+		conn_engine.park(clientsocket, resume, timeout=timeout, ready=len(self.web_request_handler.buf) > 0)
+
+	def handle_pending_messages(self):
+		while len(self.messages_to_handle) > 0:
+			if self.message_callback is not None:
+				self.message_callback(self.messages_to_handle[0])
+			self.messages_to_handle = self.messages_to_handle[1:]
+
 	def handle_messages_continuous(self):
 		while not self.end_message_handling or len(self.messages_to_handle) > 0:
-			while len(self.messages_to_handle) > 0:
-				if self.message_callback is not None:
-					self.message_callback(self.messages_to_handle[0])
-				self.messages_to_handle = self.messages_to_handle[1:]
+			self.handle_pending_messages()
 			if not self.end_message_handling:
 				with self.messages_waiting:
 					self.messages_waiting.wait()
@@ -64,11 +64,17 @@ class WebSocketInterface(object):
 				websocket_callbacks['msg_received'](handler, msg, *args)
 		clientsocket.settimeout(self.recv_timeout)
 		handler = WebSocketHandler(web_request_handler, msg_received)
+		def closed():
+			if websocket_callbacks['closed'] is not None:
+				websocket_callbacks['closed'](handler, *args)
 		if websocket_callbacks['connected'] is not None:
 			websocket_callbacks['connected'](handler, *args)
-		handler.run()
-		if websocket_callbacks['closed'] is not None:
-			websocket_callbacks['closed'](handler, *args)
+		if web_request_handler.conn_engine is not None:
+			# the selector engine holds the socket between messages instead of this thread
+			handler.run_evented(web_request_handler.conn_engine, closed)
+		else:
+			handler.run()
+			closed()
 	
 	def get_possible_split_url_params(self, url):
 		ret = []
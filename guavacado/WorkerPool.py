@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+
+'''
+bounded pool of worker threads used to handle accepted connections
+connections are queued and handled by a fixed maximum number of threads, instead of one thread per connection
+'''
+
+import threading
+import time
+import traceback
+from collections import deque
+
+from .misc import init_logger
+
+class WorkerPool(object):
+	'''
+	bounded pool of worker threads used to handle accepted connections
+	- `max_workers` is the maximum number of threads that will be started to handle queued tasks
+	- `queue_depth` is the maximum number of tasks that can wait for a free worker - `submit` blocks while the queue is full, while `try_submit` does not queue the task
+		- a value of 0 or None allows the queue to grow without limit
+	- `name` is used to name the worker threads
+	'''
+	def __init__(self, max_workers=16, queue_depth=0, name='worker_pool'):
+		self.log_handler = init_logger(__name__)
+		self.max_workers = max_workers
+		self.queue_depth = queue_depth
+		self.name = name
+		self.tasks = deque()
+		self.tasks_lock = threading.Condition()
+		self.workers = []
+		self.idle_workers = 0
+		self.stopping = False
+		self.stats = {
+			'submitted': 0,
+			'completed': 0,
+			'wait_time_total': 0.0,
+			'wait_time_max': 0.0,
+			'wait_time_last': 0.0,
+		}
+
+	def submit(self, callback, *args):
+		'''
+		queues `callback(*args)` to be run by a worker thread
+		blocks while the queue is full, which stops new connections from being accepted until a worker is free
+		returns False if the pool is stopped
+		'''
+		return self.queue_task(callback, args, block=True)
+
+	def try_submit(self, callback, *args):
+		'''
+		queues `callback(*args)` to be run by a worker thread, unless the queue is full
+		returns False without waiting if the queue is full or the pool is stopped - used by event loops, which must not block
+		'''
+		return self.queue_task(callback, args, block=False)
+
+	def queue_task(self, callback, args, block=True):
+		'''adds a task to the queue, waiting for room in the queue if `block` is True - returns whether it was queued'''
+		with self.tasks_lock:
+			while self.queue_depth and len(self.tasks) >= self.queue_depth and not self.stopping:
+				if not block:
+					return False
+				self.tasks_lock.wait()
+			if self.stopping:
+				return False
+			self.tasks.append((time.time(), callback, args))
+			self.stats['submitted'] = self.stats['submitted'] + 1
+			if self.idle_workers < len(self.tasks) and len(self.workers) < self.max_workers:
+				self.start_worker()
+			self.tasks_lock.notify_all()
+		return True
+
+	def start_worker(self):
+		'''starts a new worker thread - must be called with `tasks_lock` held'''
+		worker = threading.Thread(target=self.run_worker, name='{name}_{num}'.format(name=self.name, num=len(self.workers)))
+		worker.daemon = True # separated from Thread constructor for python2 compatibility
+		self.workers.append(worker)
+		worker.start()
+
+	def run_worker(self):
+		'''takes tasks from the queue and runs them until the pool is stopped'''
+		while True:
+			with self.tasks_lock:
+				self.idle_workers = self.idle_workers + 1
+				while len(self.tasks)==0 and not self.stopping:
+					self.tasks_lock.wait()
+				self.idle_workers = self.idle_workers - 1
+				if len(self.tasks)==0:
+					return
+				queued_time, callback, args = self.tasks.popleft()
+				wait_time = time.time() - queued_time
+				self.stats['wait_time_total'] = self.stats['wait_time_total'] + wait_time
+				self.stats['wait_time_max'] = max(self.stats['wait_time_max'], wait_time)
+				self.stats['wait_time_last'] = wait_time
+				self.tasks_lock.notify_all()
+			self.log_handler.debug('Task waited {wait:.6f} seconds in the queue of {name}'.format(wait=wait_time, name=self.name))
+			try:
+				callback(*args)
+			except Exception:
+				self.log_handler.error('An error was encountered in a task running in {name}!'.format(name=self.name))
+				self.log_handler.error(traceback.format_exc())
+			with self.tasks_lock:
+				self.stats['completed'] = self.stats['completed'] + 1
+
+	def get_stats(self):
+		'''
+		returns a dictionary describing the current state of the pool, including the time tasks spent waiting in the queue (in seconds)
+		'''
+		with self.tasks_lock:
+			ret = dict(self.stats)
+			ret['workers'] = len(self.workers)
+			ret['idle_workers'] = self.idle_workers
+			ret['queued'] = len(self.tasks)
+			started = ret['submitted'] - ret['queued']
+			if started > 0:
+				ret['wait_time_avg'] = ret['wait_time_total'] / started
+			else:
+				ret['wait_time_avg'] = 0.0
+		return ret
+
+	def stop(self, timeout=5):
+		'''stops the worker threads after any queued tasks are finished'''
+		with self.tasks_lock:
+			self.stopping = True
+			self.tasks_lock.notify_all()
+		for worker in self.workers:
+			worker.join(timeout)
+			if worker.is_alive():
+				self.log_handler.warning('Worker thread {name} did not close after {timeout} seconds! Continuing anyways...'.format(name=worker.name, timeout=timeout))
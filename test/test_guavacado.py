@@ -30,6 +30,7 @@ class GuavacadoTestEnvironment(object):
 		self.host = guavacado.WebHost(loglevel='ERROR')
 		self.host.add_addr(port=80, disp_type=('redirect', 'https://localhost/'))
 		self.host.add_addr(port=88)
+		self.host.add_addr(port=89, max_workers=2, worker_queue_depth=4)
 		self.host.add_addr(port=443, TLS=self.tls_args)
 		self.host.add_addr(port=4444, TLS=self.tls_args, disp_type=('web', 'no_files'))
 		self.host.add_addr(port=9090, disp_type=('raw_socket', self.sock_connect_TCP))
@@ -44,10 +45,23 @@ class GuavacadoTestEnvironment(object):
 		self.web_int_no_files = guavacado.WebInterface(self.host, web_dispatcher_ident='no_files')
 		self.web_int_no_files.connect('/rev/', self.reverse_body, 'GET', body_included=True)
 		self.host.start_service()
+		self.selector_host = guavacado.WebHost(loglevel='ERROR', engine='selector', selector_loops=2)
+		self.selector_host.add_addr(port=8080)
+		self.selector_host.add_addr(port=8443, TLS=self.tls_args)
+		self.selector_host.add_addr(port=8083, max_workers=1, worker_queue_depth=1)
+		self.selector_host.add_addr(port=9093, disp_type=('raw_socket', self.sock_connect_TCP))
+		self.selector_files = guavacado.WebFileInterface(self.selector_host, staticdir='served_files')
+		self.selector_web_int = guavacado.WebInterface(self.selector_host)
+		self.selector_web_int.connect('/echo/', self.echo_body, 'GET', body_included=True)
+		self.selector_web_int.connect('/sleep/', self.sleep_briefly, 'GET')
+		self.selector_websock_int = guavacado.WebSocketInterface(self.selector_host)
+		self.selector_websock_int.connect('/websock_echo/', received=self.websock_msg_recv)
+		self.selector_host.start_service()
 	
 	def stop_test_server(self):
 		'''starts the test server'''
 		self.host.stop_service()
+		self.selector_host.stop_service()
 	
 	def sock_connect_TCP(self, sock, _addr, _client_id):
 		'''TCP socket connected'''
@@ -79,6 +93,11 @@ class GuavacadoTestEnvironment(object):
 		'''returns the body exactly as sent'''
 		return body
 	
+	def sleep_briefly(self):
+		'''waits, then returns a fixed response - used to keep a worker busy'''
+		time.sleep(1)
+		return b'slept'
+	
 	def echo_param(self, param):
 		'''returns the parameter in the response body exactly as sent'''
 		return param
@@ -160,6 +179,21 @@ class TestGuavacado:
 		'''check that two different ports will serve the same index page (not absolutely necessary)'''
 		self.helpers.assertEqual(guavacado.Client.request_url('https://localhost/', TLS_check_cert=False), guavacado.Client.request_url('http://localhost:88/'))
 
+	def test_worker_pool(self):
+		'''test that concurrent connections are all handled by a bounded worker pool'''
+		results = []
+		def do_request():
+			results.append(guavacado.Client.request_url('http://localhost:89/served_files/test_serve_file.txt'))
+		threads = [threading.Thread(target=do_request) for _ in range(8)]
+		for thr in threads:
+			thr.start()
+		for thr in threads:
+			thr.join()
+		self.helpers.assertEqual(results, [(self.test_env.test_serve_file_contents,200)]*8)
+		stats = self.test_env.host.get_worker_pool_stats()['worker_:89']
+		self.helpers.assertTrue(stats['workers'] <= 2)
+		self.helpers.assertTrue(stats['submitted'] >= 8)
+
 	def test_https_redirect(self):
 		'''test redirecting from http to https'''
 		self.helpers.assertEqual(guavacado.Client.request_url('http://localhost/served_files/test_serve_file.txt')[1], 301)
@@ -212,6 +246,54 @@ class TestGuavacado:
 		self.helpers.assertEqual(guavacado.Client.request_url('https://localhost:4444/served_files/', body=self.test_env.test_function_contents, TLS_check_cert=False)[1], 404)
 		self.helpers.assertEqual(guavacado.Client.request_url('https://localhost:4444/served_files/test_serve_file.txt', body=self.test_env.test_function_contents, TLS_check_cert=False)[1], 404)
 
+	def test_selector_engine(self):
+		'''test serving files and dynamic content from a host using the selector engine'''
+		self.helpers.assertEqual(guavacado.Client.request_url('http://localhost:8080/served_files/test_serve_file.txt'), (self.test_env.test_serve_file_contents,200))
+		self.helpers.assertEqual(guavacado.Client.request_url('https://localhost:8443/test_serve_file.txt', TLS_check_cert=False), (self.test_env.test_serve_file_contents,200))
+		self.helpers.assertEqual(guavacado.Client.request_url('http://localhost:8080/echo/', body=self.test_env.test_function_contents_1200), (self.test_env.test_function_contents_1200, 200))
+		self.helpers.assertEqual(guavacado.Client.request_url('https://localhost:8443/echo/', body=self.test_env.test_function_contents, TLS_check_cert=False), (self.test_env.test_function_contents, 200))
+		client_TCP_socket = guavacado.Client(port=9093, disp_type='raw_socket').connect_socket()
+		client_TCP_socket.sendall(self.test_env.test_function_contents)
+		self.helpers.assertEqual(client_TCP_socket.recv(len(self.test_env.test_function_contents)), self.test_env.test_function_contents)
+		client_TCP_socket.close()
+		# each listener is watched by a single loop, and its connections are spread between the loops
+		engine = self.test_env.selector_host.get_dispatcher().selector_engine
+		listener_socks = [listener['listener'].sock for listener in self.test_env.selector_host.get_dispatcher().conn_listeners.values()]
+		for sock in listener_socks:
+			self.helpers.assertEqual(len([loop for loop in engine.loops if sock in loop.selector.get_map()]), 1)
+		socks = [socket.create_connection(('localhost', 8080)) for _i in range(2)]
+		for sock in socks:
+			sock.settimeout(10)
+			sock.sendall(b'GET /echo/ HTTP/1.1\r\nHost: localhost\r\nContent-Length: 2\r\n\r\nhi')
+			_headers, body, _buf = self.helpers.recv_response(sock, b'')
+			self.helpers.assertEqual(body, b'hi')
+		with engine.conns_lock:
+			conn_loops = set([conn['loop'] for conn in engine.conns.values()])
+		self.helpers.assertEqual(len(conn_loops), 2)
+		for sock in socks:
+			sock.close()
+		# with the only worker busy and the queue full, further requests get a 503 response without stopping the selector loops
+		socks = []
+		for _i in range(3):
+			sock = socket.create_connection(('localhost', 8083))
+			sock.settimeout(10)
+			sock.sendall(b'GET /sleep/ HTTP/1.1\r\nHost: localhost\r\n\r\n')
+			socks.append(sock)
+			time.sleep(0.2)
+		start = time.time()
+		self.helpers.assertEqual(guavacado.Client.request_url('http://localhost:8080/echo/', body=b'not blocked'), (b'not blocked', 200))
+		self.helpers.assertTrue(socks[2].recv(4096).startswith(b'HTTP/1.1 503 Service Unavailable\r\n'))
+		self.helpers.assertTrue(time.time() - start < 0.5)
+		for sock in socks[:2]:
+			response = b''
+			data = sock.recv(4096)
+			while data:
+				response = response + data
+				data = sock.recv(4096)
+			self.helpers.assertTrue(response.endswith(b'\r\n\r\nslept'))
+			sock.close()
+		socks[2].close()
+
 	def test_TCP_connection(self):
 		'''test TCP socket connection'''
 		self.client_TCP = guavacado.Client(port=9090, disp_type='raw_socket')
@@ -272,6 +354,8 @@ class TestGuavacado:
 		test_websocket_echo_url('ws://localhost/websock_echo/', TLS_check_cert=False, follow_redir=True)
 		test_websocket_echo_url('ws://localhost:88/websock_echo/')
 		test_websocket_echo_url('ws://localhost:88/websock_echo/', TLS_check_cert=False, follow_redir=True, data=self.test_env.test_function_contents_1200)
+		test_websocket_echo_url('ws://localhost:8080/websock_echo/', data=self.test_env.test_function_contents_1200)
+		test_websocket_echo_url('wss://localhost:8443/websock_echo/', TLS_check_cert=False)
 
 if __name__=='__main__':
 	test_env = GuavacadoTestEnvironment()